@@ -10,12 +10,47 @@ WebApp: ODE tool
 """
 
 ## Import libraries
-from src.ODE_solver import ODE, Trajectory
-from dash import Dash, html, dcc, Input, Output, State, ctx, callback_context, ALL
-import numpy as np
+from src.ODE_solver import ODE, Trajectory, render_row
+from dash import Dash, html, dcc, Input, Output, State, ctx, ALL, Patch
+from dash.exceptions import PreventUpdate
+import math
 
 app = Dash(__name__)
 
+
+## Right-hand sides of the available ODEs, compiled by ODE.set_rhs when an ODE is chosen
+def f_A(t, x):
+    return (x + 1) * math.cos(x * t)
+
+
+def f_B(t, x):
+    return -1 * x
+
+
+def f_C(t, x):
+    return -5 * x
+
+
+def f_D(t, x):
+    return math.cos(t)
+
+
+def f_E(t, x):
+    return (3*x*math.sin(t)-2*t*x)/(t**2+1)
+
+
+## Static list of the available ODEs, typeset by MathJax once when the layout loads
+ODE_EQUATIONS = dcc.Markdown('''
+A. $$y'(x, y) = (y + 1) cos(y x)$$\n
+B. $$y'(x, y) = -y$$\n
+C. $$y'(x, y) = -5y$$\n
+D. $$y'(x, y) = cos(x)$$\n
+E. $$y'(x, y) = \\frac{3ysin(x)-2xy}{x^2+1}$$
+''', mathjax=True, style={'color': '#d3d3d3',
+                          'font-family': 'Arial, Helvetica, sans-serif',
+                          'margin': '5px',
+                          'font-size': '13px'})
+
 app.layout = html.Div(children=[
     # Header container
     html.Div(children=[
@@ -38,16 +73,7 @@ app.layout = html.Div(children=[
             # Choose ODE container
             html.Div(children=[
                 html.H2('Choose ODE'),
-                dcc.Markdown('''
-                A. $$y'(x, y) = (y + 1) cos(y x)$$\n
-                B. $$y'(x, y) = -y$$\n
-                C. $$y'(x, y) = -5y$$\n
-                D. $$y'(x, y) = cos(x)$$\n
-                E. $$y'(x, y) = \\frac{3ysin(x)-2xy}{x^2+1}$$
-                ''', mathjax=True, style={'color': '#d3d3d3',
-                                          'font-family': 'Arial, Helvetica, sans-serif',
-                                          'margin': '5px',
-                                          'font-size': '13px'}),
+                ODE_EQUATIONS,
                 dcc.Dropdown(['A', 'B', 'C', 'D', 'E'], '', id='choose-ode'),
             ], className='secondary-container'),
             # Add new trajectory container
@@ -77,13 +103,15 @@ app.layout = html.Div(children=[
                 html.Br(),
                 html.Label('ODE solving method:'),
                 html.Br(),
-                dcc.Dropdown(['Forward Euler', 'Backward Euler', 'Runge Kutta 2', 'Runge Kutta 4'],
+                dcc.Dropdown(['Forward Euler', 'Backward Euler', 'Runge Kutta 2', 'Runge Kutta 4', 'Runge Kutta 45'],
                              'Forward Euler',
                              id='solving-method'
                              ),
                 html.Br(),
                 html.Button('Add', id='add-trajectory', n_clicks=0),
-                html.Div(id='container-button', style={'margin': '5px 0px 0px 0px'})
+                html.Div(children=[
+                    html.Label(id='add-message')
+                ], id='container-button', style={'margin': '5px 0px 0px 0px'})
             ], className='secondary-container', id='container-add-trajectory'),
 
         ], style={'flex': '2 1 30%'}),
@@ -103,6 +131,7 @@ app.layout = html.Div(children=[
                 step=0.1,
                 marks={i: f' {i}' if i%2==0 else str("") for i in range(0, 11)},
                 value=5,
+                updatemode='mouseup',
             ),
         ], className='secondary-container', style={'flex': '2 1 70%'}),
 
@@ -115,64 +144,67 @@ app.layout = html.Div(children=[
             id='graph',
         )
         ], className='graph-container'),
+
+    # Metadata of the added trajectories, written by the server after every add, delete or ODE switch
+    dcc.Store(id='traj-store', data=[]),
 ])
 
 
 # Switch ODE
 @app.callback(Output("trajectory-container", "children", allow_duplicate=True),
+              Output('traj-store', 'data', allow_duplicate=True),
               Input('choose-ode', 'value'),
               prevent_initial_call='initial_duplicate')
 def choose_ode(ode_choice):
     if ctx.triggered_id == 'choose-ode' and ode_choice != "":
         if ode_choice == 'A':
-            f = lambda t, x: (x + 1) * np.cos(x * t)
-            ode.f = f
+            ode.set_rhs(f_A)
             ode.nf = 'A'
         elif ode_choice == 'B':
-            f = lambda t, x: -1 * x
-            ode.f = f
+            ode.set_rhs(f_B)
             ode.nf = 'B'
         elif ode_choice == 'C':
-            f = lambda t, x: -5 * x
-            ode.f = f
+            ode.set_rhs(f_C)
             ode.nf = 'C'
         elif ode_choice == 'D':
-            f = lambda t, x: np.cos(t)
-            ode.f = f
+            ode.set_rhs(f_D)
             ode.nf = 'D'
         elif ode_choice == 'E':
-            f = lambda t, x: (3*x*np.sin(t)-2*t*x)/(t**2+1)
-            ode.f = f
+            ode.set_rhs(f_E)
             ode.nf = 'E'
         ode.trajectories = []
         ode.n = 0
     div = ode.create_div()
-    return div
+    return div, ode.create_data()
 
 
-# Print submit messages
-@app.callback(Output('container-button', 'children'),
-              Input('add-trajectory', 'n_clicks'),
-              State('solving-method', 'value'))
-def add_trajectory(btn, method):
-    if "add-trajectory" == ctx.triggered_id:
-        if ode.f != None:
-            if method != None:
-                if ode.n < 6:
-                    return html.Label('Trajectory added!')
-                else:
-                    return html.Label('Max number of trajectories reached!')
-            else:
-                return html.Label('Choose a solving method!')
-        else:
-            return html.Label('First choose an ODE to solve!')
-
-    else:
-        return None
+# Print submit messages, decided in the browser from the trajectories in the store
+app.clientside_callback(
+    """
+    function(n_clicks, method, ode_choice, trajectories) {
+        if (!n_clicks) {
+            return '';
+        } else if (!ode_choice) {
+            return 'First choose an ODE to solve!';
+        } else if (!method) {
+            return 'Choose a solving method!';
+        } else if (trajectories.length < 6) {
+            return 'Trajectory added!';
+        } else {
+            return 'Max number of trajectories reached!';
+        }
+    }
+    """,
+    Output('add-message', 'children'),
+    Input('add-trajectory', 'n_clicks'),
+    State('solving-method', 'value'),
+    State('choose-ode', 'value'),
+    State('traj-store', 'data'))
 
 
 # Add trajectory to database
 @app.callback(Output('trajectory-container', 'children', allow_duplicate=True),
+              Output('traj-store', 'data', allow_duplicate=True),
               Input('add-trajectory', 'n_clicks'),
               State('timestep', 'value'),
               State('initcondition', 'value'),
@@ -186,37 +218,50 @@ def add_trajectory(btn, h, x0, method, tf):
                 if ode.n < 6:
                     trajectory = Trajectory(ode.n, h, x0, method)
                     ode.add_trajectory(trajectory, tf)
-    div = ode.create_div()
-    return div
+                    # Only append the row of the new trajectory
+                    div = Patch()
+                    div.append(render_row(ode.n - 1, trajectory))
+                    return div, ode.create_data()
+    raise PreventUpdate
 
 
 # Delete trajectory from database
 @app.callback(Output("trajectory-container", "children", allow_duplicate=True),
+              Output('traj-store', 'data', allow_duplicate=True),
               Input({"index": ALL, "type": "delete"}, 'n_clicks'),
               prevent_initial_call='initial_duplicate')
 def delete_trajectory(*args):
-    trigger = callback_context.triggered[0]
-    if trigger['value'] == 1:
-        traj_id = int(trigger['prop_id'][9])
-        del ode.trajectories[traj_id]
-        ode.n = ode.n-1
+    # Also fires when delete buttons are added or removed, which should not touch the overview
+    if ctx.triggered_id is None or ctx.triggered[0]['value'] != 1:
+        raise PreventUpdate
+    traj_id = ctx.triggered_id['index']
+    del ode.trajectories[traj_id]
+    ode.n = ode.n-1
+    # Rows after the deleted one are renumbered, so only removing the last row can be patched
+    if traj_id == ode.n:
+        div = Patch()
+        del div[traj_id]
+        return div, ode.create_data()
     div = ode.create_div()
-    return div
+    return div, ode.create_data()
 
 
 # Update trajectory traces in plots
 @app.callback(Output('graph', 'figure', allow_duplicate=True),
               Input('sliderinput', 'value'),
-              Input('choose-ode', 'value'),
-              Input({"index": ALL, "type": "delete"}, 'n_clicks'),
-              Input('add-trajectory', 'n_clicks'),
+              Input('traj-store', 'data'),
+              State('choose-ode', 'value'),
               prevent_initial_call='initial_duplicate')
 def update_figure(*args):
-    if args[1] != "":
+    # Driven by the store rather than the buttons, so it runs after the trajectories have been updated
+    if args[2] != "":
         ode.update_trajectories(args[0])        # args[0] = final time
+        # Only the user trajectories depend on the final time, so a slider move just patches those
+        if ctx.triggered_id == 'sliderinput':
+            patch = ode.patch_traces()
+            if patch is not None:
+                return patch
         ode.update_traces()
-        ode.error_space()
-        ode.stability_region()
     return ode.fig
 
 
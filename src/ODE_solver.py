@@ -1,57 +1,383 @@
+import random
+import threading
 import numpy as np
-from scipy.optimize import fsolve
+from numba import njit, cfunc, prange, types, boolean, float64, int64, void
+from numba.core.ccallback import CFunc
+from numba.core.dispatcher import Dispatcher
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from dash import html
+from dash import html, Patch
+
+
+# Signature of the right-hand side f(t, x) of an ODE. The kernels below take f as a first-class
+# function of this type and declare their signatures, so they are compiled once at import
+# (or loaded from the on-disk cache) instead of on the first user interaction for every ODE
+RHS = float64(float64, float64)
+_rhs = types.FunctionType(RHS)
+
+
+@njit(float64(_rhs, float64, float64, float64), cache=True)
+def _step_fe(f, t, h, xi):
+    return xi + h * f(t, xi)
+
+
+@njit(float64(_rhs, float64, float64, float64), cache=True)
+def _step_be(f, t, h, xi):
+    # Explicit Euler predictor, corrected by Newton iterations on xip - xi - h*f(t+h, xip) = 0
+    xip = xi + h * f(t, xi)
+    for _ in range(6):
+        fx = f(t + h, xip)
+        # Forward difference with a step scaled to xip, so large states do not lose the perturbation
+        eps = 1.5e-8 * max(1.0, abs(xip))
+        dfdx = (f(t + h, xip + eps) - fx) / eps
+        dx = (xip - xi - h * fx) / (1 - h * dfdx)
+        xip -= dx
+        # Newton converges quadratically, so the remaining iterations would not change xip
+        if abs(dx) <= 1e-14 * max(1.0, abs(xip)):
+            break
+    return xip
+
+
+@njit(float64(_rhs, float64, float64, float64), cache=True)
+def _step_rk2(f, t, h, xi):
+    k1 = f(t, xi)
+    k2 = f(t + h, xi + k1 * h)
+    return xi + h * (1 / 2 * k1 + 1 / 2 * k2)
+
+
+@njit(float64(_rhs, float64, float64, float64), cache=True)
+def _step_rk4(f, t, h, xi):
+    k1 = f(t, xi)
+    k2 = f(t + h / 2, xi + k1 * h / 2)
+    k3 = f(t + h / 2, xi + k2 * h / 2)
+    k4 = f(t + h, xi + k3 * h)
+    return xi + h * (1 / 6 * k1 + 1 / 3 * k2 + 1 / 3 * k3 + 1 / 6 * k4)
+
+
+@njit(types.UniTuple(float64, 3)(_rhs, float64, float64, float64, float64), cache=True)
+def _stage_dp(f, t, h, xi, k1):
+    # Dormand-Prince 5(4) step from xi, with k1 = f(t, xi) already known. Returns the order 5 solution,
+    # its difference with the embedded order 4 solution and f at the new point, which is the next k1
+    k2 = f(t + h / 5, xi + h * (1 / 5 * k1))
+    k3 = f(t + 3 * h / 10, xi + h * (3 / 40 * k1 + 9 / 40 * k2))
+    k4 = f(t + 4 * h / 5, xi + h * (44 / 45 * k1 - 56 / 15 * k2 + 32 / 9 * k3))
+    k5 = f(t + 8 * h / 9, xi + h * (19372 / 6561 * k1 - 25360 / 2187 * k2 + 64448 / 6561 * k3 - 212 / 729 * k4))
+    k6 = f(t + h, xi + h * (9017 / 3168 * k1 - 355 / 33 * k2 + 46732 / 5247 * k3 + 49 / 176 * k4
+                            - 5103 / 18656 * k5))
+    xip = xi + h * (35 / 384 * k1 + 500 / 1113 * k3 + 125 / 192 * k4 - 2187 / 6784 * k5 + 11 / 84 * k6)
+    k7 = f(t + h, xip)
+    err = h * (71 / 57600 * k1 - 71 / 16695 * k3 + 71 / 1920 * k4 - 17253 / 339200 * k5 + 22 / 525 * k6
+               - 1 / 40 * k7)
+    return xip, err, k7
+
+
+@njit(float64(_rhs, float64, float64, float64), cache=True)
+def _step_rk45(f, t, h, xi):
+    # Order 5 Dormand-Prince step of prescribed size, as used by the error sweep
+    return _stage_dp(f, t, h, xi, f(t, xi))[0]
+
+
+@njit(float64(_rhs, int64, float64, float64, float64), cache=True)
+def _step(f, method_id, t, h, xi):
+    if method_id == 0:
+        return _step_fe(f, t, h, xi)
+    elif method_id == 1:
+        return _step_be(f, t, h, xi)
+    elif method_id == 2:
+        return _step_rk2(f, t, h, xi)
+    elif method_id == 3:
+        return _step_rk4(f, t, h, xi)
+    else:
+        return _step_rk45(f, t, h, xi)
+
+
+@njit(float64[::1](_rhs, int64, float64, float64, int64), cache=True)
+def _integrate(f, method_id, h, x0, n):
+    x = np.empty(n + 1)
+    x[0] = x0
+    for i in range(n):
+        x[i + 1] = _step(f, method_id, i * h, h, x[i])
+    return x
+
+
+@njit(types.UniTuple(float64[::1], 2)(_rhs, float64, float64, float64, float64, float64, boolean), cache=True)
+def _integrate_adaptive(f, h, x0, tf, atol, rtol, pi):
+    # Dormand-Prince 5(4) from t=0 to tf, starting with a trial step h. After an accepted step h is scaled
+    # by 0.9*err**(-1/5), or by 0.9*err**(-0.7/5)*err_prev**(0.4/5) with the PI controller, within [0.1, 5]
+    t = np.empty(64)
+    x = np.empty(64)
+    t[0] = 0.0
+    x[0] = x0
+    n = 1
+    k1 = f(0.0, x0)
+    err_prev = 1.0
+    while t[n - 1] < tf:
+        ti = t[n - 1]
+        xi = x[n - 1]
+        hi = min(h, tf - ti)
+        xip, err, k7 = _stage_dp(f, ti, hi, xi, k1)
+        # Local error relative to the mixed tolerance, the step is accepted if it is at most 1
+        err = abs(err) / (atol + rtol * max(abs(xi), abs(xip)))
+        if err <= 1:
+            if n == t.size:
+                t = np.concatenate((t, np.empty(n)))
+                x = np.concatenate((x, np.empty(n)))
+            t[n] = tf if hi == tf - ti else ti + hi
+            x[n] = xip
+            n += 1
+            k1 = k7
+            if err == 0:
+                factor = 5.0
+            elif pi:
+                factor = 0.9 * err ** (-0.7 / 5) * err_prev ** (0.4 / 5)
+            else:
+                factor = 0.9 * err ** (-1 / 5)
+            h = hi * min(5.0, max(0.1, factor))
+            err_prev = max(err, 1e-4)
+        else:
+            h = hi * max(0.1, 0.9 * err ** (-1 / 5))
+        # Stop where the solution blows up or the step underflows instead of looping forever
+        if not h > 1e-12 * max(1.0, tf):
+            break
+    return t[:n].copy(), x[:n].copy()
+
+
+@njit(void(_rhs, int64[::1], float64[::1], float64[::1], int64[::1], int64[::1], float64[:, ::1]), parallel=True, cache=True)
+def _integrate_batch(f, method_ids, hs, x0s, ns, bounds, out):
+    # Trajectories bounds[g]:bounds[g+1] share the method and h and are stepped in lockstep. Column k
+    # of out holds trajectory k, so each step of a group reads and writes contiguous memory
+    for g in prange(bounds.size - 1):
+        lo = bounds[g]
+        hi = bounds[g + 1]
+        method_id = method_ids[lo]
+        h = hs[lo]
+        out[0, lo:hi] = x0s[lo:hi]
+        for i in range(ns[lo]):
+            for k in range(lo, hi):
+                out[i + 1, k] = _step(f, method_id, i * h, h, out[i, k])
+
+
+@njit(float64[::1](_rhs, int64, int64[::1], float64, float64, float64), parallel=True, cache=True)
+def _error_sweep(f, method_id, ns, x0, tf, x_ref):
+    # Global error at tf of the given method for every number of steps in ns
+    err = np.empty(ns.size)
+    for k in prange(ns.size):
+        h = tf / ns[k]
+        xi = x0
+        for i in range(ns[k]):
+            xi = _step(f, method_id, i * h, h, xi)
+        err[k] = abs(xi - x_ref)
+    return err
+
+
+@njit(types.UniTuple(float64[::1], 2)(float64[::1], float64[::1], int64), cache=True)
+def _lttb(t, x, n_out):
+    # Largest-Triangle-Three-Buckets downsampling of (t, x) to n_out points
+    n = t.size
+    if n_out >= n or n_out < 3:
+        return t, x
+    t_out = np.empty(n_out)
+    x_out = np.empty(n_out)
+    t_out[0] = t[0]
+    x_out[0] = x[0]
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        lo = int((i + 1) * every) + 1
+        hi = min(int((i + 2) * every) + 1, n)
+        avg_t = t[lo:hi].mean()
+        avg_x = x[lo:hi].mean()
+        best_area = -1.0
+        best = lo - 1
+        for j in range(int(i * every) + 1, lo):
+            area = abs((t[a] - avg_t) * (x[j] - x[a]) - (t[a] - t[j]) * (avg_x - x[a]))
+            if area > best_area:
+                best_area = area
+                best = j
+        t_out[i + 1] = t[best]
+        x_out[i + 1] = x[best]
+        a = best
+    t_out[n_out - 1] = t[n - 1]
+    x_out[n_out - 1] = x[n - 1]
+    return t_out, x_out
+
+
+def _n_steps(tf, h):
+    # Number of steps of size h needed to reach tf, without an extra step when tf/h rounds up
+    return np.ceil(tf / h - 1e-9).astype(np.int64)
+
+
+@njit(float64[:, ::1](int64, float64[::1], float64[::1]), parallel=True, error_model='numpy', cache=True)
+def _stability_grid(method_id, x, y):
+    # |R(z)| of the method's amplification factor on the grid z = x + iy, evaluated point by point
+    # in a single pass without grid-sized temporaries. Row i of the result corresponds to y[i].
+    # The method is dispatched once per row, so the loop over a row is branch-free and vectorises
+    Z = np.empty((y.size, x.size))
+    for i in prange(y.size):
+        yv = y[i]
+        if method_id == 0:
+            for j in range(x.size):
+                xv = x[j]
+                Z[i, j] = np.sqrt((1+xv)**2+yv**2)
+        elif method_id == 1:
+            for j in range(x.size):
+                xv = x[j]
+                Z[i, j] = 1/np.sqrt((1-xv)**2+yv**2)
+        elif method_id == 2:
+            for j in range(x.size):
+                xv = x[j]
+                re = 1+xv+1/2*(xv**2-yv**2)
+                im = yv*(1+xv)
+                Z[i, j] = np.sqrt(re*re+im*im)
+        elif method_id == 3:
+            y2 = yv*yv
+            y3 = y2*yv
+            y4 = y2*y2
+            for j in range(x.size):
+                xv = x[j]
+                # Powers shared between the real and imaginary parts are computed once
+                x2 = xv*xv
+                x3 = x2*xv
+                re = 1+xv+1/2*(x2-y2)+1/6*(x3-3*xv*y2)+1/24*(x2*x2-6*x2*y2+y4)
+                im = yv+xv*yv+1/6*(3*x2*yv-y3)+1/6*(x3*yv-xv*y3)
+                Z[i, j] = np.sqrt(re*re+im*im)
+        else:
+            # Dormand-Prince: degree 5 Taylor polynomial plus z**6/600, evaluated by Horner
+            for j in range(x.size):
+                z = complex(x[j], yv)
+                w = 1+z*(1+z*(1/2+z*(1/6+z*(1/24+z*(1/120+z/600)))))
+                Z[i, j] = np.sqrt(w.real*w.real+w.imag*w.imag)
+    return Z
+
+
+# Methods are identified by their index in METHODS, which is also the method_id the kernels dispatch on
+METHODS = ('Forward Euler', 'Backward Euler', 'Runge Kutta 2', 'Runge Kutta 4', 'Runge Kutta 45')
+METHOD_IDS = {method: i for i, method in enumerate(METHODS)}
+ORDERS = (1, 1, 2, 4, 5)
+# Runge Kutta 45 adapts its step, its timestep is only the first trial step
+ADAPTIVE_ID = METHOD_IDS['Runge Kutta 45']
+
+# Dash callbacks run on a threaded server, but the workqueue threading layer Numba falls back to without
+# TBB or OpenMP aborts the process when parallel kernels are launched concurrently. Calls of the parallel
+# kernels are therefore serialised, process wide since the threading layer is shared by all ODE instances
+_PARALLEL_LOCK = threading.Lock()
+
+# Trajectory traces are downsampled to about the number of pixels available in the panel
+MAX_POINTS = 1000
+
+# Neither the stability regions nor the order of convergence lines depend on the ODE or the
+# trajectories, so they are evaluated once at import instead of on every figure update
+_STABILITY_AXIS = np.arange(-4.0, 4.0, 0.025)
+_STABILITY = tuple(_stability_grid(i, _STABILITY_AXIS, _STABILITY_AXIS) for i in range(len(METHODS)))
+_ORDER_H = np.geomspace(1/1024, 1, 11)
+# h**p for all methods in one broadcast power, row method_id holds the line of that method
+_ORDER_LINES = _ORDER_H[None, :] ** np.array(ORDERS)[:, None]
+
+# The measured error is the global error at SWEEP_TF for timesteps h = SWEEP_TF/n between 1e-3 and 1e-1
+SWEEP_TF = 1.0
+_SWEEP_N = np.unique(np.round(np.geomspace(10, 1000, 20))).astype(np.int64)
+
+
+# Styles of the rows in the trajectory overview, shared by all rows
+_ROW_STYLE = {'border-style': 'solid solid solid solid',
+              'margin': '10px',
+              'padding': '0px',
+              'border-radius': '5px',
+              'background': '#a1cca5'}
+_ROW_TITLE_STYLE = {'padding': '15px 0px 0px 10px',
+                    'position': 'relative',
+                    'height': '1em'}
+_ROW_TITLE_LABEL_STYLE = {'padding': '10px 0px 0px 5px',
+                          'margin': '0px'}
+_ROW_FIELDS_STYLE = {'display': 'flex',
+                     'flex-direction': 'row',
+                     'padding': '5px',
+                     'height': '2.5em',
+                     'position': 'relative'}
+_ROW_SOLVER_STYLE = {'flex': '1 1 30%', 'padding': '5px'}
+_ROW_TIMESTEP_STYLE = {'flex': '2 1 25%', 'padding': '5px'}
+_ROW_INITCONDITION_STYLE = {'flex': '3 1 25%', 'padding': '5px'}
+_ROW_DELETE_STYLE = {'flex': '5 1 20%', 'padding': '5px'}
+
+
+def _build_card(i, trajectory):
+    return html.Div(children=[
+
+        html.Div(children=[
+            html.Label('Trajectory ' + str(i+1), style=_ROW_TITLE_LABEL_STYLE)
+        ], style=_ROW_TITLE_STYLE),
+
+        html.Div(children=[
+            html.Div(children=[
+                html.Label('Solver: ' + str(trajectory.method))
+            ], style=_ROW_SOLVER_STYLE),
+
+            html.Div(children=[
+                html.Label('Timestep: ' + str(trajectory.h))
+            ], style=_ROW_TIMESTEP_STYLE),
+
+            html.Div(children=[
+                html.Label('Initial Condition: ' + str(trajectory.x0))
+            ], style=_ROW_INITCONDITION_STYLE),
+
+            html.Div(children=[
+                html.Button('Delete', id={"index": i, "type": "delete"}, n_clicks=0),
+            ], style=_ROW_DELETE_STYLE)
+        ], style=_ROW_FIELDS_STYLE)
+
+    ], style=_ROW_STYLE, className='container-trajectory')
+
+
+def render_row(i, trajectory):
+    # Row of the trajectory overview for the i-th trajectory, only rebuilt when its position or parameters change
+    key = (i, trajectory.method, trajectory.h, trajectory.x0)
+    if trajectory._card_key != key:
+        trajectory._card = _build_card(i, trajectory)
+        trajectory._card_key = key
+    return trajectory._card
 
 
 class ODE:
     def __init__(self):
         self.f = None
+        self.f_py = None
+        self.compiled_rhs = {}
         self.nf = None
         self.n = 0
         self.fig = make_subplots(1, 3, subplot_titles=('ODE solution space', 'Order of error', 'Region of stability'))
         self.trajectories = []
+        self.references = {}
+        self.solution_spaces = {}
+        self.time_grids = {}
+        self.traced = []
+        self.trace_offset = 0
 
-    def frwd_euler(self, t, h, xi, f):
-        xip = xi + h*f(t, xi)
-        return xip
-
-    def bkwrd_euler(self, t, h, xi, f):
-        xip = fsolve(lambda xip: xip - (xi + h*f(t+h, xip)), xi)
-        return xip[0]
-
-    def RK2(self, t, h, xi, f):
-        k1 = f(t, xi)
-        k2 = f(t+h, xi+k1*h)
-        xip = xi + h*(1/2*k1 + 1/2*k2)
-        return xip
-
-    def RK4(self, t, h, xi, f):
-        k1 = f(t, xi)
-        k2 = f(t + h / 2, xi + k1 * h / 2)
-        k3 = f(t + h / 2, xi + k2 * h / 2)
-        k4 = f(t + h, xi + k3 * h)
-        xip = xi + h * (1 / 6 * k1 + 1 / 3 * k2 + 1 / 3 * k3 + 1 / 6 * k4)
-        return xip
+    def set_rhs(self, f):
+        # The kernels call f through a C function pointer, so a plain Python f(t, x) is compiled to a
+        # cfunc once; f_py keeps the Python callable for calls made from Python such as solve_ivp
+        if f not in self.compiled_rhs:
+            if isinstance(f, (Dispatcher, CFunc)):
+                self.compiled_rhs[f] = f
+            else:
+                try:
+                    self.compiled_rhs[f] = cfunc(RHS, cache=True)(f)
+                except RuntimeError:
+                    # Functions without a source file, e.g. defined in a REPL or by exec, cannot be cached on disk
+                    self.compiled_rhs[f] = cfunc(RHS)(f)
+        self.f = self.compiled_rhs[f]
+        self.f_py = f
 
     def solve(self, trajectory, tf):
-        t = 0
-        xi = trajectory.x0
-        x_ls = [xi]
-        while t < tf:
-            if trajectory.method == 'Forward Euler':
-                xi = self.frwd_euler(t, trajectory.h, xi, self.f)
-            elif trajectory.method == 'Backward Euler':
-                xi = self.bkwrd_euler(t, trajectory.h, xi, self.f)
-            elif trajectory.method == 'Runge Kutta 2':
-                xi = self.RK2(t, trajectory.h, xi, self.f)
-            elif trajectory.method == 'Runge Kutta 4':
-                xi = self.RK4(t, trajectory.h, xi, self.f)
-            x_ls.append(xi)
-            t += trajectory.h
-        trajectory.t = np.arange(0, t + trajectory.h, trajectory.h)
-        trajectory.x = x_ls
+        h, x0, method_id = trajectory.h, trajectory.x0, trajectory.method_id
+        if method_id == ADAPTIVE_ID:
+            trajectory.t, trajectory.x = _integrate_adaptive(self.f, float(h), float(x0), float(tf), trajectory.atol,
+                                                             trajectory.rtol, trajectory.pi)
+        else:
+            n = _n_steps(tf, h)
+            trajectory.t = self.time_grid(h, n)
+            trajectory.x = _integrate(self.f, method_id, float(h), float(x0), n)
+        trajectory._solved_hash = trajectory.solve_key(tf)
 
     def add_trajectory(self, trajectory, tf):
         self.trajectories.append(trajectory)
@@ -60,161 +386,186 @@ class ODE:
 
     def update_trajectories(self, tf):
         for idx, trajectory in enumerate(self.trajectories):
-            self.solve(trajectory, tf)
             trajectory.id = idx
+        # Trajectories already solved with the same parameters up to this final time keep their results
+        stale = [trajectory for trajectory in self.trajectories
+                 if trajectory._solved_hash != trajectory.solve_key(tf)]
+        # Adaptive trajectories choose their own time points, so they cannot be stepped in lockstep
+        for trajectory in stale:
+            if trajectory.method_id == ADAPTIVE_ID:
+                self.solve(trajectory, tf)
+        stale = [trajectory for trajectory in stale if trajectory.method_id != ADAPTIVE_ID]
+        if not stale:
+            return
+        stale.sort(key=lambda trajectory: (trajectory.method_id, trajectory.h))
+        hs = np.array([trajectory.h for trajectory in stale], dtype=np.float64)
+        x0s = np.array([trajectory.x0 for trajectory in stale], dtype=np.float64)
+        method_ids = np.array([trajectory.method_id for trajectory in stale], dtype=np.int64)
+        ns = _n_steps(tf, hs)
+        # Start of every group of trajectories with the same method and timestep
+        new_group = np.ones(len(stale), dtype=bool)
+        new_group[1:] = (method_ids[1:] != method_ids[:-1]) | (hs[1:] != hs[:-1])
+        bounds = np.append(np.flatnonzero(new_group), len(stale)).astype(np.int64)
+        out = np.empty((ns.max() + 1, len(stale)))
+        with _PARALLEL_LOCK:
+            _integrate_batch(self.f, method_ids, hs, x0s, ns, bounds, out)
+        for k, trajectory in enumerate(stale):
+            trajectory.t = self.time_grid(trajectory.h, ns[k])
+            trajectory.x = out[:ns[k] + 1, k].copy()
+            trajectory._solved_hash = trajectory.solve_key(tf)
+
+    def time_grid(self, h, n):
+        # Time points 0, h, ..., n*h. Trajectories with the same timestep get views of one shared grid,
+        # which is only rebuilt when a longer one is needed
+        grid = self.time_grids.get(h)
+        if grid is None or grid.size < n + 1:
+            grid = np.linspace(0.0, n * h, n + 1)
+            self.time_grids[h] = grid
+        return grid[:n + 1]
 
     def create_div(self):
         div = []
-
         for i in range(self.n):
-            div.append(html.Div(children=[
-
-                html.Div(children=[
-                    html.Label('Trajectory ' + str(i+1), style={'padding': '10px 0px 0px 5px',
-                                                                'margin': '0px'})
-                ], style={'padding': '15px 0px 0px 10px',
-                          'position': 'relative',
-                          'height': '1em'}),
-
-                html.Div(children=[
-                    html.Div(children=[
-                        html.Label('Solver: ' + str(self.trajectories[i].method))
-                    ], style={'flex': '1 1 30%', 'padding': '5px'}),
-
-                    html.Div(children=[
-                        html.Label('Timestep: ' + str(self.trajectories[i].h))
-                    ], style={'flex': '2 1 25%', 'padding': '5px'}),
-
-                    html.Div(children=[
-                        html.Label('Initial Condition: ' + str(self.trajectories[i].x0))
-                    ], style={'flex': '3 1 25%', 'padding': '5px'}),
-
-                    html.Div(children=[
-                        html.Button('Delete', id={"index": i, "type": "delete"}, n_clicks=0),
-                    ], style={'flex': '5 1 20%', 'padding': '5px'})
-                ], style={'display': 'flex',
-                          'flex-direction': 'row',
-                          'padding': '5px',
-                          'height': '2.5em',
-                          'position': 'relative'})
-
-            ], style={'border-style': 'solid solid solid solid',
-                      'margin': '10px',
-                      'padding': '0px',
-                      'border-radius': '5px',
-                      'background': '#a1cca5'}, className='container-trajectory')
-            )
-
+            div.append(render_row(i, self.trajectories[i]))
         return div
 
+    def create_data(self):
+        return [{'id': i, 'h': trajectory.h, 'x0': trajectory.x0, 'method': trajectory.method}
+                for i, trajectory in enumerate(self.trajectories)]
+
     def update_traces(self):
+        # Traces are collected per subplot and added to the new figure in a single call
+        solution = self.solution_space()
+        self.trace_offset = len(solution)
+        solution += [self.trajectory_trace(trajectory, i) for i, trajectory in enumerate(self.trajectories)]
+        panels = (solution, self.error_space(), self.stability_region())
         self.fig = make_subplots(1, 3, subplot_titles=('ODE solution space', 'Order of error', 'Region of stability'))
-        self.solution_space()
+        # Keep the user's zoom and pan when the figure is rebuilt or patched
+        self.fig.update_layout(uirevision='const')
+        self.fig.add_traces([trace for panel in panels for trace in panel], rows=1,
+                            cols=[col for col, panel in enumerate(panels, 1) for _ in panel])
+        if panels[1]:
+            self.fig.update_xaxes(type="log", row=1, col=2)
+            self.fig.update_yaxes(type="log", row=1, col=2)
+        self.traced = list(self.trajectories)
+
+    def patch_traces(self):
+        # Partial update of the trajectory traces in the figure last sent to the browser;
+        # None if the set of trajectories changed since then and a full rebuild is needed
+        if self.traced != self.trajectories:
+            return None
+        patch = Patch()
         for i, trajectory in enumerate(self.trajectories):
-            self.add_traces(trajectory, i)
+            t, x = _lttb(trajectory.t, trajectory.x, MAX_POINTS)
+            patch['data'][self.trace_offset + i]['x'] = t
+            patch['data'][self.trace_offset + i]['y'] = x
+        return patch
 
-    def add_traces(self, trajectory, i):
-        self.fig.add_trace(go.Scatter(name='Trajectory ' + str(i+1),
-                                      x=trajectory.t, y=trajectory.x,
-                                      mode='lines',
-                                      line=dict(color='rgb'+str(trajectory.color)),
-                                      hovertemplate='%{y:.4f}'),
-                           row=1, col=1)
+    def trajectory_trace(self, trajectory, i):
+        t, x = _lttb(trajectory.t, trajectory.x, MAX_POINTS)
+        return go.Scattergl(name='Trajectory ' + str(i+1),
+                            x=t, y=x,
+                            mode='lines',
+                            line=dict(color=trajectory.color),
+                            hovertemplate='%{y:.4f}')
 
     def solution_space(self):
         x0s = np.linspace(0, 10, 11)
-        for x0 in x0s:
-            t = 0
-            h = 0.01
-            xi = x0
-            x_ls = [x0]
-            while t < 10:
-                xi = self.RK4(t, h, xi, self.f)
-                x_ls.append(xi)
-                t += h
-            self.fig.add_trace(go.Scatter(name='Trajectory x0='+str(x0),
-                                          x=np.arange(0, t + h, h), y=x_ls,
-                                          opacity=0.7,
-                                          mode='lines',
-                                          line=dict(color='#D3D3D3', dash='dash'),
-                                          hovertemplate='%{y:.4f}'
-                                          ),
-                               row=1, col=1)
+        h = 0.01
+        n = _n_steps(10, h)
+        # The reference trajectories only depend on the ODE, so they are integrated once per ODE
+        if self.nf not in self.solution_spaces:
+            # All reference trajectories share RK4 and h, so they form one group stepped in lockstep
+            out = np.empty((n + 1, x0s.size))
+            with _PARALLEL_LOCK:
+                _integrate_batch(self.f, np.full(x0s.size, METHOD_IDS['Runge Kutta 4'], dtype=np.int64),
+                                 np.full(x0s.size, h), x0s, np.full(x0s.size, n, dtype=np.int64),
+                                 np.array([0, x0s.size], dtype=np.int64), out)
+            self.solution_spaces[self.nf] = out
+        out = self.solution_spaces[self.nf]
+        t = self.time_grid(h, n)
+        return [go.Scattergl(name='Trajectory x0='+str(x0),
+                             x=t, y=out[:, j],
+                             opacity=0.7,
+                             mode='lines',
+                             line=dict(color='#D3D3D3', dash='dash'),
+                             hovertemplate='%{y:.4f}'
+                             ) for j, x0 in enumerate(x0s)]
 
     def error_space(self):
-        methods = []
-        for trajectory in self.trajectories:
-            methods.append(trajectory.method)
-            if self.nf == 'B':
-                self.fig.add_trace(go.Scatter(x=tuple([trajectory.h*-1]), y=tuple([0]), mode='markers', name='z=' + str(trajectory.h*-0.1)),
-                                   row=1, col=3)
-            elif self.nf == 'C':
-                self.fig.add_trace(go.Scatter(x=tuple([trajectory.h*-5]), y=tuple([0]), mode='markers', name='z=' + str(trajectory.h*-0.1)),
-                                   row=1, col=3)
-        methods = np.unique(methods)
-        for method in methods:
-            if method == "Forward Euler":
-                Oh = 1
-            elif method == "Backward Euler":
-                Oh = 1
-            elif method == "Runge Kutta 2":
-                Oh = 2
-            elif method == "Runge Kutta 4":
-                Oh = 4
-            else:
-                Oh = 0
-
-            self.fig.add_trace(go.Scatter(name='Order of Convergence '+str(method),
-                                          x=np.geomspace(1/1024, 1, 11), y=1*np.power(np.geomspace(1/1024, 1, 11), Oh),
-                                          mode='lines',
-                                          line=dict(color='#000000'),
-                                          hovertemplate='%{y:.4f}'
-                                          ), row=1, col=2)
-            self.fig.update_xaxes(type="log", row=1, col=2)
-            self.fig.update_yaxes(type="log", row=1, col=2)
+        traces = []
+        for method_id in sorted({trajectory.method_id for trajectory in self.trajectories}):
+            traces.append(go.Scattergl(name='Order of Convergence '+METHODS[method_id],
+                                       x=_ORDER_H, y=_ORDER_LINES[method_id],
+                                       mode='lines',
+                                       line=dict(color='#000000'),
+                                       hovertemplate='%{y:.4f}'
+                                       ))
+            # Measured error, starting from the first trajectory that uses this method
+            trajectory = next(t for t in self.trajectories if t.method_id == method_id)
+            x0 = float(trajectory.x0)
+            x_ref = self.reference_solution(x0, SWEEP_TF)
+            with _PARALLEL_LOCK:
+                err = _error_sweep(self.f, method_id, _SWEEP_N, x0, SWEEP_TF, x_ref)
+            traces.append(go.Scattergl(name='Error '+METHODS[method_id],
+                                       x=SWEEP_TF / _SWEEP_N, y=err,
+                                       mode='lines+markers',
+                                       line=dict(color=trajectory.color),
+                                       hovertemplate='%{y:.2e}'
+                                       ))
+        return traces
+
+    def reference_solution(self, x0, tf):
+        # Accurate solution at tf, cached per ODE and initial condition for the error sweep
+        key = (self.nf, x0, tf)
+        if key not in self.references:
+            # Only needed once a trajectory exists, so scipy is not loaded at server start
+            from scipy.integrate import solve_ivp
+            sol = solve_ivp(lambda t, x: [self.f_py(t, x[0])], (0, tf), [x0], method='DOP853', rtol=1e-12, atol=1e-12)
+            self.references[key] = sol.y[0, -1]
+        return self.references[key]
 
     def stability_region(self):
-        delta = 0.025
-        x = np.arange(-4.0, 4.0, delta)
-        y = np.arange(-4.0, 4.0, delta)
-        X, Y = np.meshgrid(x, y)
-        methods = []
+        traces = []
+        # z = h*lambda of every trajectory for the linear ODEs
         for trajectory in self.trajectories:
-            methods.append(trajectory.method)
-        methods = np.unique(methods)
-        for method in methods:
-            if method == "Forward Euler":
-                Z1=np.sqrt(np.square(1+X)+np.square(Y))
-                trace = go.Contour(name='Stability Region '+str(method), z=Z1, x=x, y=y, contours_coloring='lines',
-                                   line_width=2, contours=dict(start=1, end=1, size=2), hovertemplate='%{y:.4f}')
-                self.fig.append_trace(trace, 1, 3)
-            elif method == "Backward Euler":
-                Z2 = 1/np.sqrt(np.square(1-X)+np.square(Y))
-                trace = go.Contour(name='Stability Region '+str(method), z=Z2, x=x, y=y, contours_coloring='lines',
-                                   line_width=2, contours=dict(start=1, end=1, size=2), hovertemplate='%{y:.4f}')
-                self.fig.append_trace(trace, 1, 3)
-            elif method == "Runge Kutta 2":
-                Z3 = np.sqrt(np.square(1+X+1/2*(np.square(X)-np.square(Y))) + np.square(Y*(1+X)))
-                trace = go.Contour(name='Stability Region '+str(method), z=Z3, x=x, y=y, contours_coloring='lines',
-                                   line_width=2, contours=dict(start=1, end=1, size=2), hovertemplate='%{y:.4f}')
-                self.fig.append_trace(trace, 1, 3)
-            elif method == "Runge Kutta 4":
-                Z41 = 1+X+1/2*(np.square(X)-np.square(Y))+1/6*(np.power(X, 3)-3*X*np.square(Y))+1/24*(np.power(X, 4)-6*np.square(X)*np.square(Y)+np.power(Y, 4))
-                Z42 = Y+X*Y+1/6*(3*np.square(X)*Y-np.power(Y, 3))+1/6*(np.power(X, 3)*Y-X*np.power(Y, 3))
-                Z4 = np.sqrt(np.square(Z41)+np.square(Z42))
-                trace = go.Contour(name='Stability Region '+str(method), z=Z4, x=x, y=y, contours_coloring='lines',
-                                   line_width=2, contours=dict(start=1, end=1, size=2), hovertemplate='%{y:.4f}')
-                self.fig.append_trace(trace, 1, 3)
+            if self.nf == 'B':
+                traces.append(go.Scatter(x=tuple([trajectory.h*-1]), y=tuple([0]), mode='markers', name='z=' + str(trajectory.h*-0.1)))
+            elif self.nf == 'C':
+                traces.append(go.Scatter(x=tuple([trajectory.h*-5]), y=tuple([0]), mode='markers', name='z=' + str(trajectory.h*-0.1)))
+        for method_id in sorted({trajectory.method_id for trajectory in self.trajectories}):
+            traces.append(go.Contour(name='Stability Region '+METHODS[method_id], z=_STABILITY[method_id],
+                                     x=_STABILITY_AXIS, y=_STABILITY_AXIS, contours_coloring='lines',
+                                     line_width=2, contours=dict(start=1, end=1, size=2), hovertemplate='%{y:.4f}'))
+        return traces
 
 
 class Trajectory:
-    def __init__(self, id, h, x0, method):
+    # Fixed set of attributes, so instances need no per-instance __dict__
+    __slots__ = ('id', 'h', 'x0', 'method', 'method_id', 'atol', 'rtol', 'pi', 'color', 't', 'x',
+                 '_solved_hash', '_card', '_card_key')
+
+    def __init__(self, id, h, x0, method, atol=1e-6, rtol=1e-3, pi=False):
         self.id = id
 
         self.h = h
         self.x0 = x0
         self.method = method
-        self.color = tuple(np.random.choice(range(256), size=3))
+        self.method_id = METHOD_IDS[method]
+        # Tolerances and PI step size controller of the adaptive method
+        self.atol = atol
+        self.rtol = rtol
+        self.pi = pi
+        r, g, b = (random.randrange(256) for _ in range(3))
+        self.color = f'rgb({r},{g},{b})'
+
+        self.t = np.empty(0)
+        self.x = np.empty(0)
+        self._solved_hash = None
+        # Row of the trajectory overview, built by render_row
+        self._card = None
+        self._card_key = None
 
-        self.t = []
-        self.x = []
+    def solve_key(self, tf):
+        # Everything the solution up to tf depends on
+        return self.x0, self.h, self.method_id, tf